@@ -1,12 +1,106 @@
+import math
+from types import MappingProxyType
+from typing import Final
+
+import numpy as np
 from surmount.base_class import Strategy, TargetAllocation
-from statistics import stdev
-from surmount.technical_indicators import SMA
+
+
+# ============================================================
+# CONFIGURATION (edit these to change behavior)
+# ============================================================
+# Numeric settings live at module scope so run() reads them as plain
+# globals; assets and weight templates are configured on the class below.
+
+# 1) SMA periods
+SMA_FAST_PERIOD: Final[int] = 20
+SMA_SLOW_PERIOD: Final[int] = 32
+
+# Ratio threshold
+RATIO_STD_DIVISOR: Final[float] = 1.2
+INV_RATIO_STD_DIVISOR: Final[float] = 1.0 / RATIO_STD_DIVISOR
+
+# NEW: rolling lookback for ratio mean/stdev (initial value = 250, configurable)
+RATIO_LOOKBACK_DAYS: Final[int] = 250
+
+# 4) Market overlay thresholds (fast SMA vs. slow SMA)
+OVERLAY_LEVEL1_FAST_VS_SLOW: Final[float] = 0.99
+OVERLAY_LEVEL2_FAST_VS_SLOW: Final[float] = 0.98
+
+
+def _ratio_moments(num, den):
+    """
+    Fused num/den ratio + single-pass (Welford) statistics.
+    Returns (mean, M2), where M2 is the sum of squared deviations from the mean.
+    """
+    mean = 0.0
+    m2 = 0.0
+    for i in range(num.shape[0]):
+        ratio = num[i] / den[i]
+        delta = ratio - mean
+        mean += delta / (i + 1)
+        m2 += delta * (ratio - mean)
+    return mean, m2
+
+
+def _ratio_slide(old_num, old_den, new_num, new_den, mean, m2, n):
+    """
+    Slide a fixed-size Welford window of ``n`` ratios: each new ratio is added
+    while the matching old ratio leaves the window. Returns the updated (mean, M2).
+    """
+    for i in range(new_num.shape[0]):
+        old = old_num[i] / old_den[i]
+        new = new_num[i] / new_den[i]
+        delta = new - old
+        prev_mean = mean
+        mean += delta / n
+        m2 += delta * (new - mean + old - prev_mean)
+    return mean, m2
+
+
+def _jit(fn, signature: str):
+    """
+    Best-effort numba compilation of ``fn``; returns the plain-Python function
+    when numba is missing or compilation fails. The on-disk cache is tried
+    first, but it can't be used (or is stale) under some loaders, e.g. code
+    exec'd without a file or a module imported under a different name, so
+    any failure falls back to an uncached compile and then to plain Python.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return fn
+    for cache in (True, False):
+        try:
+            return njit(signature, cache=cache, fastmath=True)(fn)
+        except Exception:
+            continue
+    return fn
+
+
+_ratio_moments = _jit(_ratio_moments, "UniTuple(f8, 2)(f8[:], f8[:])")
+_ratio_slide = _jit(_ratio_slide, "UniTuple(f8, 2)(f8[:], f8[:], f8[:], f8[:], f8, f8, i8)")
+
+
+def _last_sma_pair(closes: np.ndarray, fast: int, slow: int):
+    """
+    Latest fast and slow simple moving averages of ``closes`` (oldest first).
+    The shorter window's sum is derived from the longer one's, so each of the
+    trailing ``max(fast, slow)`` values is read once.
+    """
+    long_len = max(fast, slow)
+    tail = closes[-long_len:]
+    long_sum = float(tail.sum())
+    short_sum = long_sum - float(tail[:long_len - min(fast, slow)].sum())
+    if fast <= slow:
+        return short_sum / fast, long_sum / slow
+    return long_sum / fast, short_sum / slow
 
 
 class TradingStrategy(Strategy):
 
     # ============================================================
-    # CONFIGURATION (edit these to change behavior)
+    # CONFIGURATION (assets and weights; edit these to change behavior)
     # ============================================================
 
     # Pair assets (relative-value signal)
@@ -17,16 +111,6 @@ class TradingStrategy(Strategy):
     BASE_ASSET = "SPY"
     LEVERAGED_ASSET = "TQQQ"
 
-    # 1) SMA periods
-    SMA_FAST_PERIOD = 20
-    SMA_SLOW_PERIOD = 32
-
-    # Ratio threshold
-    RATIO_STD_DIVISOR = 1.2
-
-    # NEW: rolling lookback for ratio mean/stdev (initial value = 250, configurable)
-    RATIO_LOOKBACK_DAYS = 250
-
     # 2) Initial default asset weights
     DEFAULT_WEIGHTS = {
         "PAIR1": 0.0,
@@ -50,10 +134,7 @@ class TradingStrategy(Strategy):
         "LEVER": 0.05,
     }
 
-    # 4) Market overlay weights
-    OVERLAY_LEVEL1_FAST_VS_SLOW = 0.99
-    OVERLAY_LEVEL2_FAST_VS_SLOW = 0.98
-
+    # 4) Market overlay weights (thresholds are configured at module level)
     OVERLAY_LEVEL1_WEIGHTS = {
         "BASE": 0.3,
         "LEVER": 0.1,
@@ -65,6 +146,66 @@ class TradingStrategy(Strategy):
         "LEVER": 0.3,
     }
 
+    # Positions in the weight vector; matches the order of ``assets``
+    _PAIR1, _PAIR2, _BASE, _LEVER = range(4)
+
+    # Rotation outcomes of the ratio signal (first index into _alloc_weights)
+    _NO_ROTATION, _TO_PAIR1, _TO_PAIR2 = range(3)
+
+    # ============================================================
+    # State
+    # ============================================================
+
+    def __init__(self):
+        # Column (SoA) cache of the ohlcv fields the signal reads: one float64
+        # array per (ticker, field), carried across run() calls so that each
+        # new bar is only read from the list of dicts once. The arrays hold
+        # twice the history depth so any trailing window is a contiguous view.
+        self._depth = max(RATIO_LOOKBACK_DAYS, SMA_FAST_PERIOD, SMA_SLOW_PERIOD)
+        self._cache = {
+            (ticker, "close"): np.empty(2 * self._depth, dtype=np.float64)
+            for ticker in (self.PAIR_ASSET_1, self.PAIR_ASSET_2, self.BASE_ASSET)
+        }
+        self._cache_len = 0
+        # Named handles on the cached columns (compaction happens in place)
+        self._num_buf = self._cache[(self.PAIR_ASSET_1, "close")]
+        self._den_buf = self._cache[(self.PAIR_ASSET_2, "close")]
+        self._spy_buf = self._cache[(self.BASE_ASSET, "close")]
+        self._last_ts = None
+
+        # Streaming (Welford) moments of the ratio over the trailing
+        # RATIO_LOOKBACK_DAYS, updated as bars enter and leave the window.
+        # They are recomputed from the cache once per full window turnover
+        # so rounding error can't accumulate.
+        self._ratio_mean = 0.0
+        self._ratio_m2 = 0.0
+        self._ratio_n = 0
+        self._ratio_slides = 0
+
+        # Weight templates resolved to weight vectors once
+        self._asset_names = tuple(self.assets)
+        default_w = self._materialize_weights(self.DEFAULT_WEIGHTS)
+        rot_p1_w = self._materialize_weights(self.ROTATE_TO_PAIR1_WEIGHTS)
+        rot_p2_w = self._materialize_weights(self.ROTATE_TO_PAIR2_WEIGHTS)
+        default_holds_pairs = any(default_w[self._PAIR1:self._PAIR2 + 1])
+        self._overlay1_pair_scale = float(self.OVERLAY_LEVEL1_WEIGHTS.get("PAIR_SCALE", 1.0))
+        self._overlay1_base = float(self.OVERLAY_LEVEL1_WEIGHTS["BASE"])
+        self._overlay1_lever = float(self.OVERLAY_LEVEL1_WEIGHTS["LEVER"])
+        self._overlay2_base = float(self.OVERLAY_LEVEL2_WEIGHTS["BASE"])
+        self._overlay2_lever = float(self.OVERLAY_LEVEL2_WEIGHTS["LEVER"])
+
+        # Every weight mix run() can return, built once as read-only mappings
+        # indexed by [rotation outcome][overlay level 0/1/2]. run() hands the
+        # host a fresh dict copy so nothing it does can leak into later bars.
+        self._alloc_weights = tuple(
+            tuple(self._build_weights(w, holds_pairs, lvl) for lvl in range(3))
+            for w, holds_pairs in (
+                (default_w, default_holds_pairs),
+                (rot_p1_w, True),
+                (rot_p2_w, True),
+            )
+        )
+
     # ============================================================
     # Surmount required properties
     # ============================================================
@@ -86,23 +227,113 @@ class TradingStrategy(Strategy):
     # Helpers
     # ============================================================
 
-    def _materialize_weights(self, template: dict) -> dict:
-        return {
-            self.PAIR_ASSET_1: float(template.get("PAIR1", 0.0)),
-            self.PAIR_ASSET_2: float(template.get("PAIR2", 0.0)),
-            self.BASE_ASSET: float(template.get("BASE", 0.0)),
-            self.LEVERAGED_ASSET: float(template.get("LEVER", 0.0)),
-        }
+    def _materialize_weights(self, template: dict) -> tuple:
+        return (
+            float(template.get("PAIR1", 0.0)),
+            float(template.get("PAIR2", 0.0)),
+            float(template.get("BASE", 0.0)),
+            float(template.get("LEVER", 0.0)),
+        )
 
-    def _ratio_series(self, ohlcv_slice: list) -> list:
+    def _build_weights(self, template: tuple, holds_pairs: bool, level: int):
         """
-        Build GOOG/AAPL (PAIR1/PAIR2) close-price ratio series over the provided slice.
-        Assumes each element has both tickers present.
+        Apply the market overlay at ``level`` (0 = none) to a weight vector
+        and return it as a read-only ticker -> weight mapping.
         """
-        return [
-            day[self.PAIR_ASSET_1]["close"] / day[self.PAIR_ASSET_2]["close"]
-            for day in ohlcv_slice
-        ]
+        weights = list(template)
+        if level >= 1:
+            # Scaling zero pair legs is a no-op, so only do it when some are held
+            if holds_pairs:
+                weights[self._PAIR1] *= self._overlay1_pair_scale
+                weights[self._PAIR2] *= self._overlay1_pair_scale
+
+            weights[self._BASE] = self._overlay1_base
+            weights[self._LEVER] = self._overlay1_lever
+
+            if level >= 2:
+                weights[self._BASE] = self._overlay2_base
+                weights[self._LEVER] = self._overlay2_lever
+
+        return MappingProxyType(dict(zip(self._asset_names, weights)))
+
+    def _new_bar_count(self, ohlcv: list):
+        """
+        Number of trailing bars in ``ohlcv`` that are not in the cache yet.
+        Returns None when the last cached bar can't be found (first call, or the
+        history was replaced), in which case the cache must be rebuilt.
+        """
+        if self._last_ts is None:
+            return None
+        for back in range(len(ohlcv)):
+            if ohlcv[-1 - back][self.PAIR_ASSET_1]["date"] == self._last_ts:
+                return back
+        return None
+
+    def _append_bars(self, ohlcv: list, n: int) -> None:
+        """
+        Write the cached fields of the last ``n`` bars straight into the cache
+        columns, compacting the last depth-worth of values to the front once
+        they run out of room. The values that just left the window are kept
+        until the next append.
+        """
+        columns = tuple(self._cache.items())
+        start = self._cache_len
+        if start + n > 2 * self._depth:
+            keep = self._depth
+            src = slice(start - keep, start)
+            for _, column in columns:
+                column[:keep] = column[src]
+            start = keep
+
+        offset = start - (len(ohlcv) - n)
+        for i in range(len(ohlcv) - n, len(ohlcv)):
+            day = ohlcv[i]
+            for (ticker, field), column in columns:
+                column[offset + i] = day[ticker][field]
+        self._cache_len = start + n
+
+    def _sync_cache(self, ohlcv: list) -> None:
+        """
+        Bring the column cache and ratio moments up to date with ``ohlcv``,
+        ingesting only the bars that arrived since the previous call.
+        """
+        new_bars = self._new_bar_count(ohlcv)
+        if new_bars is None or new_bars >= self._depth:
+            self._cache_len = 0
+            self._append_bars(ohlcv, self._depth)
+            new_bars = None
+        elif new_bars:
+            self._append_bars(ohlcv, new_bars)
+        self._last_ts = ohlcv[-1][self.PAIR_ASSET_1]["date"]
+        if new_bars != 0:
+            self._update_ratio_moments(new_bars)
+
+    def _update_ratio_moments(self, new_bars) -> None:
+        """
+        Slide the ratio moments over the ``new_bars`` most recent cache entries,
+        or recompute them over the whole window when sliding isn't possible.
+        """
+        n = RATIO_LOOKBACK_DAYS
+        end = self._cache_len
+        self._ratio_slides += new_bars or 0
+        if new_bars is None or new_bars >= n or self._ratio_slides >= n:
+            self._ratio_mean, self._ratio_m2 = _ratio_moments(
+                self._num_buf[end - n:end], self._den_buf[end - n:end]
+            )
+            self._ratio_n = n
+            self._ratio_slides = 0
+            return
+        old = slice(end - new_bars - n, end - n)
+        new = slice(end - new_bars, end)
+        self._ratio_mean, self._ratio_m2 = _ratio_slide(
+            self._num_buf[old],
+            self._den_buf[old],
+            self._num_buf[new],
+            self._den_buf[new],
+            self._ratio_mean,
+            self._ratio_m2,
+            n,
+        )
 
     # ============================================================
     # Strategy logic
@@ -112,58 +343,51 @@ class TradingStrategy(Strategy):
         ohlcv = data["ohlcv"]
 
         # Need enough data for ratio window AND SMA windows
-        min_needed = max(4, self.RATIO_LOOKBACK_DAYS, self.SMA_SLOW_PERIOD)
+        min_needed = max(4, self._depth)
         if len(ohlcv) < min_needed:
             return TargetAllocation({})
 
+        self._sync_cache(ohlcv)
+        end = self._cache_len
+
         # -------------------------
-        # Rolling ratio statistics
+        # Market trend (SMA-based)
         # -------------------------
-        lookback = min(self.RATIO_LOOKBACK_DAYS, len(ohlcv))
-        window = ohlcv[-lookback:]  # last N days
-        ratio = self._ratio_series(window)
-
-        # If stdev can't be computed (e.g., len==1), avoid trading
-        if len(ratio) < 2:
-            return TargetAllocation({})
-
-        mean_ratio = sum(ratio) / len(ratio)
-        dev_ratio = stdev(ratio)
-
-        upper_band = mean_ratio + dev_ratio / self.RATIO_STD_DIVISOR
-        lower_band = mean_ratio - dev_ratio / self.RATIO_STD_DIVISOR
-
-        # Default allocation
-        weights = self._materialize_weights(self.DEFAULT_WEIGHTS)
-
-        # Rotation logic based on rolling bands
-        if ratio[-1] > upper_band:
-            weights = self._materialize_weights(self.ROTATE_TO_PAIR2_WEIGHTS)
-        elif ratio[-1] < lower_band:
-            weights = self._materialize_weights(self.ROTATE_TO_PAIR1_WEIGHTS)
+        spy_closes = self._spy_buf[:end]
+        ma_fast, ma_slow = _last_sma_pair(
+            spy_closes, SMA_FAST_PERIOD, SMA_SLOW_PERIOD
+        )
+        overlay_level = 0
+        if ma_fast < OVERLAY_LEVEL1_FAST_VS_SLOW * ma_slow:
+            overlay_level = 1
+            if ma_fast < OVERLAY_LEVEL2_FAST_VS_SLOW * ma_slow:
+                overlay_level = 2
 
         # -------------------------
-        # Market overlay (SMA-based)
+        # Rolling ratio statistics
         # -------------------------
-        ma_fast_series = SMA(self.BASE_ASSET, ohlcv, self.SMA_FAST_PERIOD)
-        ma_slow_series = SMA(self.BASE_ASSET, ohlcv, self.SMA_SLOW_PERIOD)
-
-        if not ma_fast_series or not ma_slow_series:
+        # If stdev can't be computed (e.g., len==1), avoid trading
+        if self._ratio_n < 2:
             return TargetAllocation({})
 
-        ma_fast = ma_fast_series[-1]
-        ma_slow = ma_slow_series[-1]
+        rotation = self._NO_ROTATION
 
-        if ma_fast < self.OVERLAY_LEVEL1_FAST_VS_SLOW * ma_slow:
-            pair_scale = float(self.OVERLAY_LEVEL1_WEIGHTS.get("PAIR_SCALE", 1.0))
-            weights[self.PAIR_ASSET_1] *= pair_scale
-            weights[self.PAIR_ASSET_2] *= pair_scale
+        # The overlay scales the pair legs; when it zeroes them the rotation
+        # can't change the outcome, so the band test is skipped.
+        if overlay_level == 0 or self._overlay1_pair_scale != 0.0:
+            mean_ratio = self._ratio_mean
+            dev_ratio = math.sqrt(max(self._ratio_m2, 0.0) / (self._ratio_n - 1))
+            today_ratio = self._num_buf[end - 1] / self._den_buf[end - 1]
 
-            weights[self.BASE_ASSET] = float(self.OVERLAY_LEVEL1_WEIGHTS["BASE"])
-            weights[self.LEVERAGED_ASSET] = float(self.OVERLAY_LEVEL1_WEIGHTS["LEVER"])
+            half_band = dev_ratio * INV_RATIO_STD_DIVISOR
+            upper_band = mean_ratio + half_band
+            lower_band = mean_ratio - half_band
 
-            if ma_fast < self.OVERLAY_LEVEL2_FAST_VS_SLOW * ma_slow:
-                weights[self.BASE_ASSET] = float(self.OVERLAY_LEVEL2_WEIGHTS["BASE"])
-                weights[self.LEVERAGED_ASSET] = float(self.OVERLAY_LEVEL2_WEIGHTS["LEVER"])
+            # Rotation logic based on rolling bands
+            if today_ratio > upper_band:
+                rotation = self._TO_PAIR2
+            elif today_ratio < lower_band:
+                rotation = self._TO_PAIR1
 
-        return TargetAllocation(weights)
\ No newline at end of file
+        # Market overlay is already folded into the cached weights
+        return TargetAllocation(dict(self._alloc_weights[rotation][overlay_level]))
\ No newline at end of file